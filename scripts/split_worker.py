@@ -0,0 +1,156 @@
+"""
+Worker de splits e ingestas.
+
+Toma trabajos de la cola (ver src/services/job_queue.py) y los ejecuta fuera del
+proceso de uvicorn. Se pueden levantar tantas instancias como se quiera junto a
+la API (docker compose up --scale worker=N); cada trabajo lo procesa un solo
+worker gracias al lease con visibility timeout.
+
+Uso:
+    python scripts/split_worker.py [--worker-id ID] [--once]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.config.settings import settings
+from src.services.elasticsearch_service import AsyncElasticsearchService
+from src.services.job_queue import get_job_queue
+from src.services.pdf_processor import PDFProcessor, PDF_BASE_DIR
+from src.utils.logger import setup_logger
+from src.utils import metrics
+
+logger = setup_logger("split_worker")
+
+stop_event = threading.Event()
+
+
+def handle_split(payload):
+    processor = PDFProcessor()
+    mode = payload.get("mode", "local")
+    chunk_size = payload.get("chunk_size", 1000)
+    if mode == "sftp":
+        return processor.split_pdf_sftp(payload["filename"], chunk_size)
+    if mode == "ftp":
+        return processor.split_pdf_ftp(payload["filename"], chunk_size)
+    return processor.split_pdf_v2(payload["filename"], chunk_size, payload.get("virtual", False))
+
+
+async def handle_ingest(payload, es_service):
+    pdf_path = Path(payload["pdf_path"])
+    if not pdf_path.is_absolute():
+        pdf_path = Path(PDF_BASE_DIR or "/data/pdfs") / pdf_path
+    if not pdf_path.exists():
+        raise FileNotFoundError(f"El archivo {pdf_path} no existe")
+
+    # El worker procesa un trabajo a la vez: la extracción puede bloquear el loop
+    processor = PDFProcessor()
+    content_hash = processor.content_hash(str(pdf_path))
+    cached = await es_service.get_cached_content(content_hash)
+    exists = await es_service.document_exists(payload["archivo_digital_id"])
+    result = processor.process_pdf(
+        str(pdf_path), payload["file_name"], payload["expediente_id"], payload["cuaderno_id"],
+        payload["documento_id"], payload["archivo_digital_id"], payload["nro_expediente"],
+        payload["anio_expediente"], payload["documento_nombre"],
+        exists=exists, content_hash=content_hash, cached=cached
+    )
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+
+    await processor.store_result(result, content_hash, es_service)
+
+    return {
+        "status": result["status"],
+        "message": result["message"],
+        "file_name": result["file_name"],
+        "existence": result["exists"],
+        "pages_processed": result["pages_processed"],
+        "dedup": result["dedup"]
+    }
+
+
+def _heartbeat(queue, job_id, worker_id, done):
+    """Renueva el lease mientras el trabajo siga corriendo."""
+    interval = max(1, settings.JOB_VISIBILITY_TIMEOUT // 3)
+    while not done.wait(interval):
+        if not queue.heartbeat(job_id, worker_id):
+            logger.warning(f"Se perdió el lease del trabajo {job_id}")
+            return
+
+
+def _cleanup_spool(job):
+    """Borra el PDF subido a la cola cuando ya no habrá más intentos."""
+    pdf_path = job["payload"].get("spool_path")
+    if pdf_path and os.path.exists(pdf_path):
+        try:
+            os.unlink(pdf_path)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar {pdf_path}: {e}")
+
+
+def run_job(queue, job, worker_id, es_service, loop):
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(queue, job["id"], worker_id, done), daemon=True)
+    heartbeat.start()
+    logger.info(f"[{worker_id}] Procesando trabajo {job['type']} {job['id']} (intento {job['attempts']}/{job['max_attempts']})")
+    try:
+        if job["type"] == "split":
+            result = handle_split(job["payload"])
+        elif job["type"] == "ingest":
+            result = loop.run_until_complete(handle_ingest(job["payload"], es_service))
+        else:
+            raise ValueError(f"Tipo de trabajo desconocido: {job['type']}")
+    except Exception as e:
+        logger.error(f"[{worker_id}] Error en trabajo {job['id']}: {str(e)}")
+        queue.fail(job["id"], worker_id, str(e))
+        if job["attempts"] >= job["max_attempts"]:
+            _cleanup_spool(job)
+    else:
+        queue.complete(job["id"], worker_id, result)
+        _cleanup_spool(job)
+        logger.info(f"[{worker_id}] Trabajo {job['id']} completado (métricas: {metrics.snapshot()})")
+    finally:
+        done.set()
+        heartbeat.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de splits e ingestas")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--once", action="store_true", help="Procesa a lo sumo un trabajo y termina")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    queue = get_job_queue()
+    # Mismo cliente async que la API, para compartir PDFProcessor.store_result
+    loop = asyncio.new_event_loop()
+    es_service = AsyncElasticsearchService()
+    logger.info(f"Worker {args.worker_id} iniciado (backend: {settings.JOB_QUEUE_BACKEND})")
+
+    while not stop_event.is_set():
+        job = queue.lease(args.worker_id)
+        if job is None:
+            if args.once:
+                break
+            stop_event.wait(settings.JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job, args.worker_id, es_service, loop)
+        if args.once:
+            break
+
+    loop.run_until_complete(es_service.close())
+    loop.close()
+    logger.info(f"Worker {args.worker_id} detenido")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from src.services.elasticsearch_service import ElasticsearchService
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from src.services.elasticsearch_service import AsyncElasticsearchService
 from src.services.pdf_processor import PDFProcessor
+from src.services.job_queue import get_job_queue
+from src.services.scheduler import AdmissionScheduler, AdmissionRejected
+from src.utils.pdf_methods import UtilsPDFMethods
+from src.config.settings import settings
 from src.models.schemas import SearchRequest, SearchResult
 from src.utils.logger import setup_logger
-from typing import List
+from src.utils import metrics
+from typing import List, Optional
 import tempfile
+import json
 import os
+import shutil
+import uuid
 from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
@@ -17,10 +25,60 @@ class SplitRequest(BaseModel):
     filename: str
     chunk_size: int = 1000
 
-def setup_routes(app: FastAPI, es_service: ElasticsearchService, pdf_processor: PDFProcessor):
+class SplitJobRequest(SplitRequest):
+    mode: str = "local"  # local | sftp | ftp
+    virtual: bool = False  # solo modo local: escribe el índice y las partes se sirven a demanda
+
+class MetadataBatchRequest(BaseModel):
+    directory: Optional[str] = None
+    paths: Optional[List[str]] = None
+    max_workers: Optional[int] = None
+
+def _spool_upload(source) -> str:
+    """Copia el PDF subido a JOB_SPOOL_DIR (bloqueante, se llama en el threadpool)."""
+    os.makedirs(settings.JOB_SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(settings.JOB_SPOOL_DIR, f"{uuid.uuid4().hex}.pdf")
+    source.seek(0)
+    with open(spool_path, "wb") as spool_file:
+        shutil.copyfileobj(source, spool_file, 1024 * 1024)
+    return spool_path
+
+def _busy_response(retry_after: int, file_name: str):
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+        content={
+            "status": "failure",
+            "message": f"Servidor ocupado, reintente en {retry_after} segundos",
+            "file_name": file_name,
+            "existence": -1,
+            "pages_processed": 0,
+            "pages": []
+        }
+    )
+
+def setup_routes(app: FastAPI, es_service: AsyncElasticsearchService, pdf_processor: PDFProcessor):
+    scheduler = AdmissionScheduler()
+
+    @app.middleware("http")
+    async def upload_admission(request: Request, call_next):
+        # Rechazo rápido antes de que FastAPI lea y guarde el multipart: con
+        # parámetros File()/Form() el cuerpo completo se recibe antes de entrar a upload_pdf.
+        # Aún no se conoce el tamaño: solo se rechaza si tampoco entraría un documento
+        # de un slot (los grandes que no puedan empezar los rechaza admit())
+        if (request.method == "POST" and request.url.path == "/upload"
+                and scheduler.is_saturated() and not scheduler.can_start(1)):
+            await run_in_threadpool(metrics.incr, "admision_rechazos")
+            return _busy_response(scheduler.retry_after(), None)
+        return await call_next(request)
+
     @app.on_event("startup")
     async def startup_event():
-        es_service.create_index()
+        await es_service.create_index()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await es_service.close()
 
     @app.post("/upload")
     async def upload_pdf(
@@ -55,21 +113,36 @@ def setup_routes(app: FastAPI, es_service: ElasticsearchService, pdf_processor:
             temp_file_path = temp_file.name
 
         try:
-            result = pdf_processor.process_pdf(
-                temp_file_path, final_file_name, expediente_id, cuaderno_id,
-                documento_id, archivo_digital_id, nro_expediente, anio_expediente, documento_nombre, es_service
-            )
+            # Si el mismo archivo ya se extrajo (otro archivoDigitalId), se reutiliza su contenido
+            content_hash = await run_in_threadpool(pdf_processor.content_hash, temp_file_path)
+            cached = await es_service.get_cached_content(content_hash)
+            exists = await es_service.document_exists(archivo_digital_id)
+            try:
+                pages = await run_in_threadpool(pdf_processor.page_count, temp_file_path)
+            except Exception:
+                pages = 0  # PDF ilegible: process_pdf devolverá el error
+            wanted_slots = 0 if cached is not None else pdf_processor.fanout_workers(pages)
+            try:
+                async with scheduler.admit(pages, wanted_slots) as tika_slots:
+                    # La extracción (Tika / PyMuPDF) es bloqueante: fuera del event loop
+                    result = await run_in_threadpool(
+                        pdf_processor.process_pdf,
+                        temp_file_path, final_file_name, expediente_id, cuaderno_id,
+                        documento_id, archivo_digital_id, nro_expediente, anio_expediente, documento_nombre,
+                        exists=exists, content_hash=content_hash, cached=cached, max_workers=tika_slots
+                    )
+            except AdmissionRejected as e:
+                await run_in_threadpool(metrics.incr, "admision_rechazos")
+                return _busy_response(e.retry_after, final_file_name)
             if result["status"] == "success":
-                if result["exists"] == 1:
-                    es_service.update_document(result["doc"])
-                else:
-                    es_service.index_document(result["doc"])
+                await pdf_processor.store_result(result, content_hash, es_service)
                 return {
                     "status": result["status"],
                     "message": result["message"],
                     "file_name": result["file_name"],
                     "existence": result["exists"],
                     "pages_processed": result["pages_processed"],
+                    "dedup": result["dedup"],
                     "pages": result["pages"]
                 }
             else:
@@ -81,6 +154,7 @@ def setup_routes(app: FastAPI, es_service: ElasticsearchService, pdf_processor:
                         "file_name": result["file_name"],
                         "existence": result["exists"],
                         "pages_processed": result["pages_processed"],
+                        "dedup": result["dedup"],
                         "pages": result["pages"]
                         
                     }
@@ -89,9 +163,27 @@ def setup_routes(app: FastAPI, es_service: ElasticsearchService, pdf_processor:
             os.unlink(temp_file_path)
 
     @app.post("/split-pdf")
-    def split_pdf_endpoint_v2(input_pdf: str = Form(...), chunk_size: int = Form(1000)):
-        result = pdf_processor.split_pdf_v2(input_pdf, chunk_size)
+    def split_pdf_endpoint_v2(input_pdf: str = Form(...), chunk_size: int = Form(1000), virtual: bool = Form(False)):
+        result = pdf_processor.split_pdf_v2(input_pdf, chunk_size, virtual)
         return result
+
+    @app.get(
+        "/split-pdf/part",
+        summary="Descarga una parte de un PDF particionado",
+        description="Arma a demanda la parte indicada a partir del PDF original y su indice.txt "
+                    "(sirve tanto para splits virtuales como materializados).",
+        tags=["Items"]
+    )
+    def split_pdf_part(input_pdf: str, part: int):
+        try:
+            part_name, content = pdf_processor.build_part(input_pdf, part)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return Response(
+            content=content,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="{part_name}"'}
+        )
     
     @app.post("/split-pdf-sftp")
     def split_pdf(req: SplitRequest):
@@ -109,4 +201,87 @@ def setup_routes(app: FastAPI, es_service: ElasticsearchService, pdf_processor:
     def split_pdf(req: SplitRequest):
         splitter = PDFProcessor()
         result = splitter.split_pdf_ftp(req.filename, req.chunk_size)
-        return result
\ No newline at end of file
+        return result
+
+    # -------- Cola de trabajos (procesados por scripts/split_worker.py) --------
+    job_queue = get_job_queue()
+
+    @app.post("/jobs/split", status_code=202)
+    async def enqueue_split(req: SplitJobRequest):
+        if req.mode not in ("local", "sftp", "ftp"):
+            raise HTTPException(status_code=400, detail=f"Modo de split inválido: {req.mode}")
+        if req.virtual and req.mode != "local":
+            raise HTTPException(status_code=400, detail="El split virtual solo está disponible en modo local")
+        job_id = await run_in_threadpool(job_queue.enqueue, "split", req.model_dump())
+        return {"job_id": job_id, "status": "pending"}
+
+    @app.post("/jobs/ingest", status_code=202)
+    async def enqueue_ingest(
+        file: UploadFile = File(None),
+        pdf_path: str = Form(None),
+        file_name: str = Form(None),
+        expediente_id: int = Form(0),
+        cuaderno_id: int = Form(0),
+        documento_id: int = Form(6),
+        archivo_digital_id: int = Form(6),
+        nro_expediente: str = Form("EXP-XYZZZZZ"),
+        documento_nombre: str = Form("Documento Ejemplo"),
+        anio_expediente: int = Form(2025)
+    ):
+        """Encola una ingesta: con un PDF subido (se guarda en JOB_SPOOL_DIR) o con una ruta bajo PDF_BASE_DIR."""
+        if file is None and not pdf_path:
+            raise HTTPException(status_code=400, detail="Debe enviar file o pdf_path")
+
+        payload = {
+            "file_name": file_name or (file.filename if file else os.path.basename(pdf_path)),
+            "expediente_id": expediente_id,
+            "cuaderno_id": cuaderno_id,
+            "documento_id": documento_id,
+            "archivo_digital_id": archivo_digital_id,
+            "nro_expediente": nro_expediente,
+            "documento_nombre": documento_nombre,
+            "anio_expediente": anio_expediente
+        }
+        if file is not None:
+            if not file.filename.lower().endswith(".pdf"):
+                raise HTTPException(status_code=400, detail="Only PDF files are allowed!")
+            spool_path = await run_in_threadpool(_spool_upload, file.file)
+            payload["pdf_path"] = spool_path
+            payload["spool_path"] = spool_path
+        else:
+            payload["pdf_path"] = pdf_path
+
+        job_id = await run_in_threadpool(job_queue.enqueue, "ingest", payload)
+        return {"job_id": job_id, "status": "pending"}
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = await run_in_threadpool(job_queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+        return job
+
+
+    # -------- Metadatos remotos --------
+    @app.post(
+        "/metadata/batch",
+        summary="Metadatos de varios PDFs en el servidor SFTP",
+        description="Inspecciona en paralelo un directorio remoto y/o una lista de rutas. "
+                    "Devuelve una línea JSON por archivo (application/x-ndjson) a medida que terminan.",
+        tags=["Items"]
+    )
+    def metadata_batch(req: MetadataBatchRequest):
+        if req.directory is None and not req.paths:
+            raise HTTPException(status_code=400, detail="Debe enviar directory o paths")
+
+        def generar():
+            for result in UtilsPDFMethods().get_metadata_batch(req.paths, req.directory, req.max_workers):
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+
+        return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+
+    @app.get("/metrics")
+    async def get_metrics():
+        """Contadores de la API y de los workers (dedup_hits, dedup_misses, paginas_extraidas...)."""
+        return await run_in_threadpool(metrics.snapshot)
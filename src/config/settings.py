@@ -9,5 +9,52 @@ class Settings:
     ELASTICSEARCH_PASSWORD = os.getenv("ELASTICSEARCH_PASSWORD", "tu_clave")
     TIKA_SERVER_URL = os.getenv("TIKA_SERVER_URL", "http://tika:9998")
     INDEX_NAME = "archivo_digital_edi"
+    # Índice auxiliar hash del archivo -> contenido extraído, para no volver a pasar por Tika
+    HASH_INDEX_NAME = "archivo_digital_edi_hash"
 
-settings = Settings()
\ No newline at end of file
+    # Transporte del cliente de Elasticsearch
+    ES_MAXSIZE = int(os.getenv("ES_MAXSIZE", 25))
+    ES_HTTP_COMPRESS = os.getenv("ES_HTTP_COMPRESS", "true").lower() in ("1", "true", "yes")
+    ES_TIMEOUT = int(os.getenv("ES_TIMEOUT", 60))
+    ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", 3))
+    ES_RETRY_BACKOFF = float(os.getenv("ES_RETRY_BACKOFF", 0.5))
+
+    # Fan-out de PDFs grandes: por encima del umbral de páginas el documento se
+    # procesa en rangos de FANOUT_CHUNK_SIZE páginas repartidos entre procesos
+    FANOUT_PAGE_THRESHOLD = int(os.getenv("FANOUT_PAGE_THRESHOLD", 100))
+    FANOUT_CHUNK_SIZE = int(os.getenv("FANOUT_CHUNK_SIZE", 50))
+    FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", 4))
+
+    # Control de admisión de la API: documentos simultáneos, peticiones a Tika en
+    # vuelo (compartidas entre documentos) y documentos en espera antes de responder 429
+    ADMISSION_MAX_DOCUMENTS = int(os.getenv("ADMISSION_MAX_DOCUMENTS", 4))
+    TIKA_MAX_INFLIGHT = int(os.getenv("TIKA_MAX_INFLIGHT", 8))
+    TIKA_RESERVED_SLOTS = int(os.getenv("TIKA_RESERVED_SLOTS", 2))  # solo para documentos de un slot
+    # Límite global (todos los procesos y contenedores) de peticiones a Tika en vuelo,
+    # implementado con locks de archivo en un directorio compartido
+    TIKA_SLOTS_DIR = os.getenv("TIKA_SLOTS_DIR", "data/tika_slots")
+    TIKA_SLOT_POLL_INTERVAL = float(os.getenv("TIKA_SLOT_POLL_INTERVAL", 0.1))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 20))
+    ADMISSION_AGING_SECONDS = float(os.getenv("ADMISSION_AGING_SECONDS", 60))
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 30))
+
+    # Caché de partes virtuales servidas por GET /split-pdf/part
+    PART_CACHE_MAX_BYTES = int(os.getenv("PART_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+    # Cola de trabajos para scripts/split_worker.py
+    JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+    # Rutas relativas al directorio de trabajo; docker-compose las fija en el volumen compartido
+    JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "data/queue/jobs.db")
+    JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", "data/queue/spool")
+    JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", 600))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BACKOFF = int(os.getenv("JOB_RETRY_BACKOFF", 30))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))
+    # Contadores de /metrics compartidos entre procesos (por defecto en la base de la cola)
+    METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", JOB_QUEUE_PATH)
+
+    # Inventario de metadatos remotos (/metadata/batch)
+    METADATA_MAX_WORKERS = int(os.getenv("METADATA_MAX_WORKERS", 8))
+    METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 50000))
+
+settings = Settings()
@@ -1,10 +1,10 @@
 from fastapi import FastAPI
-from src.services.elasticsearch_service import ElasticsearchService
+from src.services.elasticsearch_service import AsyncElasticsearchService
 from src.services.pdf_processor import PDFProcessor
 from src.api.routes import setup_routes
 
 app = FastAPI()
-es_service = ElasticsearchService()
+es_service = AsyncElasticsearchService()
 pdf_processor = PDFProcessor()
 
 setup_routes(app, es_service, pdf_processor)
\ No newline at end of file
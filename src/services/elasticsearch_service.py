@@ -1,33 +1,130 @@
-from elasticsearch import Elasticsearch
+import asyncio
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elasticsearch.exceptions import ConnectionError as ESConnectionError, ConnectionTimeout, NotFoundError, TransportError
 from src.config.settings import settings
 from src.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
-class ElasticsearchService:
+# El índice de hashes solo se consulta por _id: no se indexa el contenido, solo se guarda
+HASH_INDEX_MAPPING = {
+    "mappings": {
+        "dynamic": False,
+        "properties": {
+            "hashContenido": {"type": "keyword"}
+        }
+    }
+}
+
+
+def _transport_options(**overrides):
+    """Opciones de conexión comunes al cliente síncrono y al asíncrono."""
+    options = {
+        "http_auth": (settings.ELASTICSEARCH_USER, settings.ELASTICSEARCH_PASSWORD),
+        "maxsize": settings.ES_MAXSIZE,
+        # El contenido por página pesa varios MB; gzip reduce mucho el tráfico
+        "http_compress": settings.ES_HTTP_COMPRESS,
+        "timeout": settings.ES_TIMEOUT,
+        "max_retries": settings.ES_MAX_RETRIES,
+        "retry_on_timeout": True,
+    }
+    options.update(overrides)
+    return options
+
+
+class _ElasticsearchRequests:
+    """
+    Parámetros de cada operación, comunes al cliente síncrono y al asíncrono.
+
+    Las subclases solo se ocupan de enviarlos (y de los reintentos en el caso async).
+    """
+
+    def __init__(self):
+        self.index_name = settings.INDEX_NAME
+        self.hash_index_name = settings.HASH_INDEX_NAME
+
+    def _index_definitions(self):
+        return [(self.index_name, {}), (self.hash_index_name, HASH_INDEX_MAPPING)]
+
+    def _get_cached_request(self, content_hash):
+        return {"index": self.hash_index_name, "id": content_hash}
+
+    def _store_cached_request(self, content_hash, page_contents, metadata):
+        return {
+            "index": self.hash_index_name,
+            "id": content_hash,
+            "body": {
+                "hashContenido": content_hash,
+                "contenido": page_contents,
+                "metadata": metadata
+            }
+        }
+
+    def _index_document_request(self, doc):
+        # _id determinista: si un reintento por timeout repite una escritura ya aplicada, la sobrescribe
+        return {"index": self.index_name, "id": str(doc["archivoDigitalId"]), "body": doc}
+
+    def _update_document_request(self, doc):
+        return {"index": self.index_name, "body": doc, "conflicts": "proceed"}
+
+    def _document_exists_request(self, archivo_digital_id):
+        return {
+            "index": self.index_name,
+            "body": {
+                "query": {
+                    "term": {
+                        "archivoDigitalId": archivo_digital_id
+                    }
+                },
+                "size": 1  # Limitar a 1 resultado para optimizar
+            }
+        }
+
+    def _search_request(self, query):
+        return {"index": self.index_name, "body": query}
+
+
+class ElasticsearchService(_ElasticsearchRequests):
     def __init__(self):
+        super().__init__()
         self.es = Elasticsearch(
             [settings.ELASTICSEARCH_URL],
-            http_auth=(settings.ELASTICSEARCH_USER, settings.ELASTICSEARCH_PASSWORD)
+            **_transport_options()
         )
-        self.index_name = settings.INDEX_NAME
 
     def create_index(self):
-        mapping = {}
-        if not self.es.indices.exists(index=self.index_name):
-            self.es.indices.create(index=self.index_name, body=mapping)
-            logger.info(f"Created Elasticsearch index: {self.index_name}")
+        for index_name, mapping in self._index_definitions():
+            if not self.es.indices.exists(index=index_name):
+                self.es.indices.create(index=index_name, body=mapping)
+                logger.info(f"Created Elasticsearch index: {index_name}")
+
+    def get_cached_content(self, content_hash):
+        """Devuelve {"contenido", "metadata"} ya extraídos para un archivo idéntico, o None."""
+        try:
+            return self.es.get(**self._get_cached_request(content_hash))["_source"]
+        except NotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error consultando hash {content_hash}: {str(e)}")
+            return None
+
+    def store_cached_content(self, content_hash, page_contents, metadata):
+        try:
+            self.es.index(**self._store_cached_request(content_hash, page_contents, metadata))
+        except Exception as e:
+            # No es crítico: solo se pierde la deduplicación de este archivo
+            logger.error(f"Error guardando hash {content_hash}: {str(e)}")
 
     def index_document(self, doc):
         try:
-            self.es.index(index=self.index_name, body=doc)
+            self.es.index(**self._index_document_request(doc))
             logger.info("Document indexed successfully")
         except Exception as e:
             logger.error(f"Error indexing document: {str(e)}")
             raise
     def update_document(self, doc):
         try:
-            response = self.es.update_by_query(index=self.index_name, body=doc, conflicts="proceed")
+            response = self.es.update_by_query(**self._update_document_request(doc))
             #logger.info("Document updated successfully")
             #return response
             logger.info(response)
@@ -49,17 +146,7 @@ class ElasticsearchService:
         """
         try:            
             # Realizar la búsqueda
-            response = self.es.search(
-                index=self.index_name,
-                body={
-                    "query": {
-                        "term": {
-                            "archivoDigitalId": archivo_digital_id
-                        }
-                    },
-                    "size": 1  # Limitar a 1 resultado para optimizar
-                }
-            )
+            response = self.es.search(**self._document_exists_request(archivo_digital_id))
             
             # Verificar si hay documentos en los resultados
             if response["hits"]["total"]["value"] > 0:
@@ -73,8 +160,97 @@ class ElasticsearchService:
     
     def search(self, query):
         try:
-            response = self.es.search(index=self.index_name, body=query)
+            response = self.es.search(**self._search_request(query))
             return response
         except Exception as e:
             logger.error(f"Search error: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+
+class AsyncElasticsearchService(_ElasticsearchRequests):
+    """
+    Variante asíncrona de ElasticsearchService para usar desde las rutas de FastAPI.
+
+    Los reintentos se hacen aquí (y no en el transporte) para poder esperar con
+    backoff exponencial entre intentos sin bloquear el event loop.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.es = AsyncElasticsearch(
+            [settings.ELASTICSEARCH_URL],
+            **_transport_options(max_retries=0, retry_on_timeout=False)
+        )
+
+    async def _retry(self, operation, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await operation(*args, **kwargs)
+            except TransportError as e:
+                # 429 (rechazo por carga) también se reintenta; otros errores HTTP no
+                retryable = isinstance(e, (ConnectionTimeout, ESConnectionError)) or e.status_code == 429
+                if not retryable or attempt >= settings.ES_MAX_RETRIES:
+                    raise
+                delay = settings.ES_RETRY_BACKOFF * (2 ** attempt)
+                attempt += 1
+                logger.warning(f"Elasticsearch no disponible ({str(e)}), reintento {attempt} en {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.es.close()
+
+    async def create_index(self):
+        for index_name, mapping in self._index_definitions():
+            if not await self._retry(self.es.indices.exists, index=index_name):
+                await self._retry(self.es.indices.create, index=index_name, body=mapping)
+                logger.info(f"Created Elasticsearch index: {index_name}")
+
+    async def get_cached_content(self, content_hash):
+        try:
+            response = await self._retry(self.es.get, **self._get_cached_request(content_hash))
+            return response["_source"]
+        except NotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error consultando hash {content_hash}: {str(e)}")
+            return None
+
+    async def store_cached_content(self, content_hash, page_contents, metadata):
+        try:
+            await self._retry(self.es.index, **self._store_cached_request(content_hash, page_contents, metadata))
+        except Exception as e:
+            logger.error(f"Error guardando hash {content_hash}: {str(e)}")
+
+    async def index_document(self, doc):
+        try:
+            await self._retry(self.es.index, **self._index_document_request(doc))
+            logger.info("Document indexed successfully")
+        except Exception as e:
+            logger.error(f"Error indexing document: {str(e)}")
+            raise
+
+    async def update_document(self, doc):
+        try:
+            response = await self._retry(self.es.update_by_query, **self._update_document_request(doc))
+            logger.info(response)
+            return response
+        except Exception as e:
+            logger.error(f"Error updating document: {str(e)}")
+            raise
+
+    async def document_exists(self, archivo_digital_id):
+        """Igual que ElasticsearchService.document_exists: 1 si existe, 0 si no y -1 ante error."""
+        try:
+            response = await self._retry(self.es.search, **self._document_exists_request(archivo_digital_id))
+            return 1 if response["hits"]["total"]["value"] > 0 else 0
+        except Exception as e:
+            logger.error(f"Error al verificar el documento: {e}")
+            return -1
+
+    async def search(self, query):
+        try:
+            return await self._retry(self.es.search, **self._search_request(query))
+        except Exception as e:
+            logger.error(f"Search error: {str(e)}")
+            raise
@@ -0,0 +1,244 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def _remove_spool(payload: dict):
+    """Borra el PDF subido a JOB_SPOOL_DIR de un trabajo que ya no se reintentará."""
+    spool_path = payload.get("spool_path")
+    if spool_path and os.path.exists(spool_path):
+        try:
+            os.unlink(spool_path)
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar {spool_path}: {e}")
+
+
+class JobQueue(ABC):
+    """
+    Interfaz de la cola de trabajos (split / ingest) que consumen los workers.
+
+    Un trabajo tomado con lease() queda invisible para otros workers durante
+    visibility_timeout segundos. Si el worker no llama a complete()/fail() en ese
+    plazo (se cayó, se reinició el contenedor), el trabajo vuelve a estar
+    disponible y se reintenta hasta max_attempts veces.
+
+    Es abstracta: un backend que no implemente todos los métodos falla al
+    instanciarse (get_job_queue) y no a mitad de un trabajo.
+    """
+
+    @abstractmethod
+    def enqueue(self, job_type: str, payload: dict, max_attempts: int = None) -> str:
+        ...
+
+    @abstractmethod
+    def lease(self, worker_id: str, visibility_timeout: int = None):
+        """Toma el siguiente trabajo disponible o devuelve None si no hay ninguno."""
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str, visibility_timeout: int = None) -> bool:
+        """Extiende el lease de un trabajo largo. Devuelve False si ya no le pertenece al worker."""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: dict = None):
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: str):
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str):
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    """Backend por defecto: un archivo SQLite compartido (volumen) entre la API y los workers."""
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.JOB_QUEUE_PATH
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        """Crea el archivo y la tabla en el primer uso (no al importar la API)."""
+        if self._schema_ready:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    leased_by TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_disponibles ON jobs (status, available_at)")
+        finally:
+            conn.close()
+        self._schema_ready = True
+
+    @contextmanager
+    def _connect(self):
+        self._ensure_schema()
+        # isolation_level=None: las transacciones se controlan con BEGIN IMMEDIATE explícito
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, job_type, payload, max_attempts=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, payload, status, attempts, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload), PENDING,
+                 max_attempts or settings.JOB_MAX_ATTEMPTS, now, now, now)
+            )
+        logger.info(f"Trabajo {job_type} encolado: {job_id}")
+        return job_id
+
+    def lease(self, worker_id, visibility_timeout=None):
+        visibility_timeout = visibility_timeout or settings.JOB_VISIBILITY_TIMEOUT
+        now = time.time()
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Leases vencidos que ya agotaron sus intentos no se vuelven a entregar
+                # (el worker murió en el último intento y no llegó a limpiar su spool)
+                expirados = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = ? AND available_at <= ? AND attempts >= max_attempts",
+                    (LEASED, now)
+                ).fetchall()
+                for expirado in expirados:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = COALESCE(error, 'visibility timeout agotado'), updated_at = ? "
+                        "WHERE id = ?",
+                        (FAILED, now, expirado["id"])
+                    )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status IN (?, ?) AND available_at <= ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (PENDING, LEASED, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, leased_by = ?, available_at = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (LEASED, worker_id, now + visibility_timeout, now, row["id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        for expirado in expirados:
+            _remove_spool(json.loads(expirado["payload"]))
+        if row is None:
+            return None
+        job = self._row_to_dict(row)
+        job["attempts"] += 1
+        job["status"] = LEASED
+        job["leased_by"] = worker_id
+        return job
+
+    def heartbeat(self, job_id, worker_id, visibility_timeout=None):
+        visibility_timeout = visibility_timeout or settings.JOB_VISIBILITY_TIMEOUT
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET available_at = ?, updated_at = ? WHERE id = ? AND status = ? AND leased_by = ?",
+                (now + visibility_timeout, now, job_id, LEASED, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND leased_by = ?",
+                (DONE, json.dumps(result or {}), time.time(), job_id, LEASED, worker_id)
+            )
+
+    def fail(self, job_id, worker_id, error):
+        now = time.time()
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND leased_by = ?",
+                    (job_id, LEASED, worker_id)
+                ).fetchone()
+                if row is not None:
+                    if row["attempts"] >= row["max_attempts"]:
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                            (FAILED, error, now, job_id)
+                        )
+                    else:
+                        # Backoff exponencial entre reintentos
+                        delay = settings.JOB_RETRY_BACKOFF * (2 ** (row["attempts"] - 1))
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, leased_by = NULL, available_at = ?, updated_at = ? WHERE id = ?",
+                            (PENDING, error, now + delay, now, job_id)
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def _row_to_dict(self, row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+# Backends disponibles; otros (Redis, SQS...) se registran con register_backend()
+JOB_QUEUE_BACKENDS = {
+    "sqlite": SQLiteJobQueue,
+}
+
+
+def register_backend(name: str, backend_cls):
+    JOB_QUEUE_BACKENDS[name] = backend_cls
+
+
+def get_job_queue(backend: str = None) -> JobQueue:
+    backend = backend or settings.JOB_QUEUE_BACKEND
+    if backend not in JOB_QUEUE_BACKENDS:
+        raise ValueError(f"Backend de cola desconocido: {backend}")
+    return JOB_QUEUE_BACKENDS[backend]()
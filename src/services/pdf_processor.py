@@ -5,11 +5,19 @@ import tempfile
 import paramiko
 from src.config.settings import settings
 from src.utils.logger import setup_logger
-from src.services.elasticsearch_service import ElasticsearchService
+from src.utils.tika_limiter import tika_slot
+from src.services.elasticsearch_service import ElasticsearchService, AsyncElasticsearchService
+from src.utils import metrics
 from pathlib import Path
+import asyncio
 import stat
 from ftplib import FTP, error_perm
 import math, os, shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 logger = setup_logger(__name__)
 
@@ -29,6 +37,95 @@ FTP_PASSWORD = os.getenv("FTP_PASSWORD")
 FTP_HOST = os.getenv("FTP_HOST")
 FTP_PORT = int(os.getenv("FTP_PORT", 21))
 
+
+def _extraer_rango(pdf_path, tika_server_url, start, end):
+    """
+    Extrae con Tika el texto de las páginas [start, end] (base 0) de un PDF.
+
+    Se usa tanto en el flujo serial como en los procesos hijos del fan-out, por
+    eso abre su propia copia del documento y usa temporales únicos por página.
+
+    :return: tupla (page_contents, metadata) donde numeroPagina es global al documento
+    """
+    tika.TikaClientOnly = True
+    # Configurar opciones para forzar OCR
+    request_options = {
+        "headers": {
+            "X-Tika-PDFocrStrategy": "ocr_and_text",
+            "X-Tika-OCRLanguage": "spa"
+        }
+    }
+    page_contents = []
+    metadata = {}
+
+    with fitz.open(pdf_path) as pdf:
+        for page_num in range(start, end + 1):
+            page_pdf = fitz.open()
+            page_pdf.insert_pdf(pdf, from_page=page_num, to_page=page_num)
+            fd, temp_pdf = tempfile.mkstemp(prefix=f"temp_page_{page_num + 1}_", suffix=".pdf")
+            os.close(fd)
+            page_pdf.save(temp_pdf)
+            page_pdf.close()
+            logger.info(f"Processing page {page_num + 1} with Tika")
+
+            try:
+                # Cada página ocupa un slot del límite global de Tika (compartido con los workers)
+                with tika_slot():
+                    #opción solo con TXTS PURO Ó ESCANEADO
+                    parsed = parser.from_file(temp_pdf, tika_server_url, xmlContent=False) #originalmente estaba así
+
+                #opción para que tomo todo dentro de una página (fotos incrustadas y escaneado (híbrido)), esto es más completo, pero demasiado lento y a veces duplica el texto de una hoja
+                #parsed = parser.from_file(temp_pdf, tika_server_url, requestOptions=request_options, xmlContent=False)
+            finally:
+                os.remove(temp_pdf)
+
+            content = (parsed.get("content", "") or "").strip()
+            logger.info(f"Extracted content length: {len(content)}")
+
+            # if not content:
+            #     logger.info(f"Content empty, trying OCR for page {page_num + 1}")
+            #     parsed = parser.from_file(temp_pdf, tika_server_url, xmlContent=False, requestOptions={"X-Tika-PDFocrStrategy": "ocr_only"})
+            #     content = parsed.get("content", "").strip()
+            #     logger.info(f"OCR content length: {len(content)}")
+
+            page_contents.append({"numeroPagina": page_num + 1, "texto": content})
+            metadata = parsed.get("metadata", {})
+
+    return page_contents, metadata
+
+class PartCache:
+    """Caché LRU de partes virtuales, acotada por la suma de bytes de los PDFs guardados."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, item):
+        size = len(item[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key)[1])
+            self._items[key] = item
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted[1])
+
+
+_part_cache = PartCache(settings.PART_CACHE_MAX_BYTES)
+
+
 class PDFProcessor:
     def __init__(self):
         tika.TikaClientOnly = True
@@ -37,7 +134,84 @@ class PDFProcessor:
         self.transport = None
         self.sftp = None
 
-    def process_pdf(self, pdf_path, file_name, expediente_id, cuaderno_id, documento_id, archivo_digital_id, nro_expediente, anio_expediente, documento_nombre, es: ElasticsearchService):
+    def _rangos_fanout(self, total_pages):
+        """Devuelve los rangos (start, end) base 0 en que se procesará el documento."""
+        if total_pages <= settings.FANOUT_PAGE_THRESHOLD:
+            return [(0, total_pages - 1)] if total_pages else []
+        chunk_size = max(1, settings.FANOUT_CHUNK_SIZE)
+        return [
+            (start, min(start + chunk_size, total_pages) - 1)
+            for start in range(0, total_pages, chunk_size)
+        ]
+
+    def page_count(self, pdf_path):
+        with fitz.open(pdf_path) as pdf:
+            return pdf.page_count
+
+    def fanout_workers(self, total_pages):
+        """Procesos (y por tanto peticiones simultáneas a Tika) que usaría extract_pages."""
+        rangos = self._rangos_fanout(total_pages)
+        return max(1, min(settings.FANOUT_MAX_WORKERS, len(rangos)))
+
+    def extract_pages(self, pdf_path, max_workers: int = None):
+        """
+        Extrae el contenido de todas las páginas del PDF.
+
+        Los documentos por encima de FANOUT_PAGE_THRESHOLD páginas se cortan en
+        rangos que se procesan en paralelo en varios procesos; los resultados se
+        unen en orden, con numeroPagina global al documento.
+
+        :param max_workers: tope de procesos (p. ej. los slots de Tika concedidos por el scheduler)
+        :return: tupla (page_contents, metadata)
+        """
+        total_pages = self.page_count(pdf_path)
+
+        rangos = self._rangos_fanout(total_pages)
+        if len(rangos) <= 1:
+            if not rangos:
+                return [], {}
+            return _extraer_rango(pdf_path, self.tika_server_url, *rangos[0])
+
+        max_workers = max(1, min(max_workers or settings.FANOUT_MAX_WORKERS, settings.FANOUT_MAX_WORKERS, len(rangos)))
+
+        page_contents = []
+        metadata = {}
+        if max_workers == 1:
+            # Un solo slot de Tika: un pool spawn solo sumaría el arranque de procesos (re-importar fitz, tika...)
+            logger.info(f"Extracción de {total_pages} páginas en {len(rangos)} rangos en el mismo proceso")
+            for start, end in rangos:
+                contenido_rango, metadata_rango = _extraer_rango(pdf_path, self.tika_server_url, start, end)
+                page_contents.extend(contenido_rango)
+                metadata = metadata_rango or metadata
+            return page_contents, metadata
+
+        logger.info(f"Fan-out de {total_pages} páginas en {len(rangos)} rangos con {max_workers} procesos")
+        # spawn: el proceso de uvicorn tiene hilos, no es seguro hacer fork
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futuros = [
+                pool.submit(_extraer_rango, pdf_path, self.tika_server_url, start, end)
+                for start, end in rangos
+            ]
+            try:
+                for futuro in futuros:
+                    contenido_rango, metadata_rango = futuro.result()
+                    page_contents.extend(contenido_rango)
+                    metadata = metadata_rango or metadata
+            except Exception:
+                # El documento ya falló: no seguir mandando a Tika los rangos pendientes
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        return page_contents, metadata
+
+    def content_hash(self, pdf_path, block_size: int = 1024 * 1024):
+        """SHA-256 del archivo completo; identifica el mismo PDF subido con otro archivoDigitalId."""
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            while block := f.read(block_size):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def process_pdf(self, pdf_path, file_name, expediente_id, cuaderno_id, documento_id, archivo_digital_id, nro_expediente, anio_expediente, documento_nombre, es: ElasticsearchService = None, exists: int = None, content_hash: str = None, cached: dict = None, max_workers: int = None):
         """
         Actualiza un documento en Elasticsearch por archivoDigitalId.
 
@@ -50,51 +224,26 @@ class PDFProcessor:
         :param nro_expediente: nuevo valor para nroExpediente
         :param anio_expediente: nuevo valor para anioExpediente
         :param contenido: lista de objetos con {"pagina": int, "texto": str}
+        :param exists: resultado de document_exists ya calculado (p. ej. con el cliente async); si es None se consulta con es
+        :param content_hash: hash del archivo (content_hash), se guarda en archivoDigital.hashContenido
+        :param cached: {"contenido", "metadata"} de un archivo idéntico ya extraído; si viene, no se llama a Tika
+        :param max_workers: tope de procesos del fan-out (slots de Tika concedidos)
         """
-        # Configurar opciones para forzar OCR
-        request_options = {
-            "headers": {
-                "X-Tika-PDFocrStrategy": "ocr_and_text",
-                "X-Tika-OCRLanguage": "spa"
-            }
-        }
         try:
             logger.info(f"Processing PDF: {file_name}")
-            response = parser.from_buffer("Test", self.tika_server_url)
-            logger.info("Tika server connection successful")
-
-            pdf = fitz.open(pdf_path)
-            pages_processed = 0
-            page_contents = []
-
-            for page_num in range(pdf.page_count):
-                page_pdf = fitz.open()
-                page_pdf.insert_pdf(pdf, from_page=page_num, to_page=page_num)
-                temp_pdf = f"temp_page_{page_num + 1}.pdf"
-                page_pdf.save(temp_pdf)
-                page_pdf.close()
-                logger.info(f"Processing page {page_num + 1} with Tika")
-
-                #opción solo con TXTS PURO Ó ESCANEADO
-                parsed = parser.from_file(temp_pdf, self.tika_server_url, xmlContent=False) #originalmente estaba así
-
-                #opción para que tomo todo dentro de una página (fotos incrustadas y escaneado (híbrido)), esto es más completo, pero demasiado lento y a veces duplica el texto de una hoja
-                #parsed = parser.from_file(temp_pdf, self.tika_server_url, requestOptions=request_options, xmlContent=False)
-
-                content = (parsed.get("content", "") or "").strip()
-                logger.info(f"Extracted content length: {len(content)}")
+            if cached is not None:
+                logger.info(f"Archivo ya extraído (hash {content_hash}), se reutiliza el contenido")
+                page_contents, metadata = cached["contenido"], cached.get("metadata", {})
+            else:
+                response = parser.from_buffer("Test", self.tika_server_url)
+                logger.info("Tika server connection successful")
 
-                # if not content:
-                #     logger.info(f"Content empty, trying OCR for page {page_num + 1}")
-                #     parsed = parser.from_file(temp_pdf, self.tika_server_url, xmlContent=False, requestOptions={"X-Tika-PDFocrStrategy": "ocr_only"})
-                #     content = parsed.get("content", "").strip()
-                #     logger.info(f"OCR content length: {len(content)}")
+                page_contents, metadata = self.extract_pages(pdf_path, max_workers)
+            pages_processed = len(page_contents)
 
-                page_contents.append({"numeroPagina": page_num + 1, "texto": content})
-                pages_processed += 1
-                os.remove(temp_pdf)
             #es = ElasticsearchService
-            exists = es.document_exists(archivo_digital_id)
+            if exists is None:
+                exists = es.document_exists(archivo_digital_id)
             if exists == 1:
                 doc = {
                     "query": {
@@ -110,17 +259,19 @@ class PDFProcessor:
                         "ctx._source.metadata = params.metadata; "
                         "ctx._source.anioExpediente = params.anioExpediente; "
                         "ctx._source.documentoNombre = params.documentoNombre; "
-                        "ctx._source.archivoDigital.contenido = params.contenido;",
+                        "ctx._source.archivoDigital.contenido = params.contenido; "
+                        "ctx._source.archivoDigital.hashContenido = params.hashContenido;",
                         "lang": "painless",
                         "params": {
                             "expedienteId": expediente_id,
                             "cuadernoId": cuaderno_id,
                             "documentoId": documento_id,
                             "nroExpediente": nro_expediente,
-                            "metadata": parsed.get("metadata", {}),
+                            "metadata": metadata,
                             "anioExpediente": anio_expediente,
                             "documentoNombre": documento_nombre,
-                            "contenido": page_contents
+                            "contenido": page_contents,
+                            "hashContenido": content_hash
                         }
                     }
                 }
@@ -134,16 +285,16 @@ class PDFProcessor:
                     "expedienteId": expediente_id,
                     "numeroExpediente": nro_expediente,
                     "documentoNombre": documento_nombre,
-                    "metadata": parsed.get("metadata", {}),
+                    "metadata": metadata,
                     "archivoDigital": {
                         "rutaArchivoDigital": pdf_path,
+                        "hashContenido": content_hash,
                         "contenido": page_contents
                     },
                     "acciones": {}
                 }
 
 
-            pdf.close()
             return {
                 "status": "success",
                 "file_name": file_name,
@@ -151,6 +302,8 @@ class PDFProcessor:
                 "message": "All file processed successfully",
                 "exists": exists,
                 "pages_processed": pages_processed,
+                "dedup": cached is not None,
+                "metadata": metadata,
                 "doc": doc
             }
             #return doc
@@ -162,8 +315,28 @@ class PDFProcessor:
                 "pages_processed": 0,
                 "exists": -1,
                 "pages": [],
+                "dedup": False,
                 "message": "Error processing PDF: "+str(e)
             }
+
+    async def store_result(self, result, content_hash: str, es: AsyncElasticsearchService):
+        """
+        Guarda un resultado exitoso de process_pdf: indexa o actualiza el documento,
+        registra las métricas de dedup y, si hubo extracción, el contenido por hash.
+
+        Lo comparten /upload y scripts/split_worker.py.
+        """
+        if result["exists"] == 1:
+            await es.update_document(result["doc"])
+        else:
+            await es.index_document(result["doc"])
+        # Las métricas escriben en SQLite: fuera del event loop
+        if result["dedup"]:
+            await asyncio.to_thread(metrics.incr, "dedup_hits")
+        else:
+            await asyncio.to_thread(metrics.incr, "dedup_misses")
+            await asyncio.to_thread(metrics.incr, "paginas_extraidas", result["pages_processed"])
+            await es.store_cached_content(content_hash, result["pages"], result["metadata"])
         
 
     def split_pdf(self, input_pdf: str, out_dir: str, chunk_size: int = 1000):
@@ -185,7 +358,7 @@ class PDFProcessor:
                     new_doc = fitz.open()  # doc vacío
 
                     new_doc.insert_pdf(doc, from_page=start, to_page=end)
-                    new_doc.save(out_file, deflate=False, garbage=0)
+                    new_doc.save(out_file, deflate=True, garbage=3)
                     new_doc.close()
 
                     idx.write(f"{out_file.name} [{start+1}-{end+1}]\n")
@@ -197,7 +370,7 @@ class PDFProcessor:
             "output_dir": str(output_dir)
         }
     
-    def split_pdf_v2(self, input_pdf: str, chunk_size: int = 1000):
+    def _resolve_input(self, input_pdf: str):
         input_path = Path(input_pdf)
 
         # Si solo pasaron el nombre del archivo → lo buscamos en la carpeta base
@@ -206,11 +379,29 @@ class PDFProcessor:
 
         if not input_path.exists():
             raise FileNotFoundError(f"El archivo {input_path} no existe")
+        return input_path
+
+    def split_pdf_v2(self, input_pdf: str, chunk_size: int = 1000, virtual: bool = False):
+        """
+        Particiona un PDF local en partes de chunk_size páginas.
+
+        Con virtual=True solo se escribe indice.txt (mismo formato); cada parte se
+        arma a demanda desde el original con build_part() / GET /split-pdf/part.
+        """
+        input_path = self._resolve_input(input_pdf)
 
         # Crear carpeta de salida al lado del archivo original
         output_dir = input_path.parent / f"{input_path.stem}_parts"
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        if virtual:
+            # Partes físicas de un split anterior ya no corresponden al índice.
+            # Sin glob: los nombres de expediente pueden traer "[" o "]"
+            prefix = f"{input_path.stem}_part"
+            for old_part in output_dir.iterdir():
+                if old_part.name.startswith(prefix) and old_part.suffix == ".pdf":
+                    old_part.unlink()
+
         with fitz.open(str(input_path)) as doc:
             total_pages = len(doc)
             n_parts = math.ceil(total_pages / chunk_size)
@@ -222,10 +413,11 @@ class PDFProcessor:
                     end = min(start + chunk_size, total_pages) - 1
                     out_file = output_dir / f"{input_path.stem}_part{i+1:05d}.pdf"
 
-                    new_doc = fitz.open()
-                    new_doc.insert_pdf(doc, from_page=start, to_page=end)
-                    new_doc.save(out_file, deflate=False, garbage=0)
-                    new_doc.close()
+                    if not virtual:
+                        new_doc = fitz.open()
+                        new_doc.insert_pdf(doc, from_page=start, to_page=end)
+                        new_doc.save(out_file, deflate=True, garbage=3)
+                        new_doc.close()
 
                     idx.write(f"{out_file.name} [{start+1}-{end+1}]\n")
 
@@ -233,8 +425,49 @@ class PDFProcessor:
             "total_pages": total_pages,
             "parts": n_parts,
             "index_file": str(indice_path),
-            "output_dir": str(output_dir)
+            "output_dir": str(output_dir),
+            "virtual": virtual
         }
+
+    def build_part(self, input_pdf: str, part: int):
+        """
+        Arma en memoria la parte `part` (1..n) según el indice.txt de split_pdf_v2.
+
+        Las partes recientes quedan en una caché acotada por tamaño (PART_CACHE_MAX_BYTES),
+        invalidada si cambia el original o el índice.
+
+        :return: tupla (nombre_parte, bytes del PDF)
+        """
+        input_path = self._resolve_input(input_pdf)
+        indice_path = input_path.parent / f"{input_path.stem}_parts" / "indice.txt"
+        if not indice_path.exists():
+            raise FileNotFoundError(f"No existe el índice {indice_path}, ejecute primero el split")
+
+        source_stat = input_path.stat()
+        indice_stat = indice_path.stat()
+        cache_key = (str(input_path), source_stat.st_mtime_ns, source_stat.st_size, indice_stat.st_mtime_ns, part)
+        cached = _part_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        part_name = f"{input_path.stem}_part{part:05d}.pdf"
+        with open(indice_path, encoding="utf-8") as idx:
+            for line in idx:
+                name, _, page_range = line.strip().rpartition(" ")
+                if name == part_name:
+                    start, end = [int(n) for n in page_range.strip("[]").split("-")]
+                    break
+            else:
+                raise FileNotFoundError(f"La parte {part} no está en {indice_path}")
+
+        with fitz.open(str(input_path)) as doc:
+            new_doc = fitz.open()
+            new_doc.insert_pdf(doc, from_page=start - 1, to_page=end - 1)
+            content = new_doc.tobytes(garbage=3, deflate=True)
+            new_doc.close()
+
+        _part_cache.put(cache_key, (part_name, content))
+        return part_name, content
     
     #METODO FTP
 
@@ -369,7 +602,7 @@ class PDFProcessor:
 
                         new_doc = fitz.open()
                         new_doc.insert_pdf(doc, from_page=start, to_page=end)
-                        new_doc.save(out_file, deflate=False, garbage=0)
+                        new_doc.save(out_file, deflate=True, garbage=3)
                         new_doc.close()
 
                         idx.write(f"{out_file.name} [{start+1}-{end+1}]\n")
@@ -450,7 +683,7 @@ class PDFProcessor:
 
                         new_doc = fitz.open()
                         new_doc.insert_pdf(doc, from_page=start, to_page=end)
-                        new_doc.save(out_file, deflate=False, garbage=0)
+                        new_doc.save(out_file, deflate=True, garbage=3)
                         new_doc.close()
 
                         idx.write(f"{out_file.name} [{start+1}-{end+1}]\n")
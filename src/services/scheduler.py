@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """La cola de admisión está llena; el cliente debe reintentar en retry_after segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Servidor ocupado, reintente en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionScheduler:
+    """
+    Control de admisión para el procesamiento de documentos en la API.
+
+    Limita cuántos documentos se procesan a la vez (max_documents) y reparte un
+    presupuesto global de peticiones simultáneas a Tika (tika_budget): cada
+    documento recibe entre 1 y los slots que pide (procesos del fan-out), según
+    lo que quede libre. Los documentos grandes (más de un slot) no pueden usar
+    los últimos TIKA_RESERVED_SLOTS slots ni el último lugar de documento, que
+    quedan para los pequeños. Los documentos en espera se atienden primero por menor
+    número de páginas; la espera acumulada va reduciendo la prioridad efectiva
+    para que los grandes no queden relegados indefinidamente. Con la cola llena
+    se rechaza de inmediato (AdmissionRejected -> 429 con Retry-After).
+
+    Se usa desde el event loop de uvicorn; no es thread-safe.
+    """
+
+    def __init__(self, max_documents: int = None, tika_budget: int = None, max_queue: int = None):
+        self.max_documents = max_documents or settings.ADMISSION_MAX_DOCUMENTS
+        self.tika_budget = tika_budget or settings.TIKA_MAX_INFLIGHT
+        self.max_queue = max_queue if max_queue is not None else settings.ADMISSION_MAX_QUEUE
+        # Siempre queda al menos un slot para documentos grandes
+        self.tika_reserved = max(0, min(settings.TIKA_RESERVED_SLOTS, self.tika_budget - 1))
+        self.max_large_documents = max(1, self.max_documents - 1)
+        self._running = 0
+        self._running_large = 0
+        self._tika_free = self.tika_budget
+        self._waiting = []  # [pages, seq, enqueued_at, wanted, future]
+        self._seq = itertools.count()
+        self._avg_duration = float(settings.ADMISSION_RETRY_AFTER)
+
+    def is_saturated(self) -> bool:
+        return len(self._waiting) >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Estimación de cuándo habrá lugar, a partir de la duración media de los documentos."""
+        turns = (len(self._waiting) + 1) / self.max_documents
+        return max(1, math.ceil(self._avg_duration * turns))
+
+    def can_start(self, wanted: int) -> bool:
+        """Indica si un documento que pide `wanted` slots de Tika podría empezar ya."""
+        if self._running >= self.max_documents:
+            return False
+        if wanted <= 1:
+            return wanted == 0 or self._tika_free >= 1
+        return (self._running_large < self.max_large_documents
+                and self._tika_free - self.tika_reserved >= 1)
+
+    def _grant(self, wanted: int) -> int:
+        if wanted > 1:
+            slots = min(wanted, self._tika_free - self.tika_reserved)
+            self._running_large += 1
+        else:
+            slots = min(wanted, self._tika_free)
+        self._tika_free -= slots
+        self._running += 1
+        return slots
+
+    def _release(self, slots: int, wanted: int):
+        self._tika_free += slots
+        self._running -= 1
+        if wanted > 1:
+            self._running_large -= 1
+        self._dispatch()
+
+    def _priority(self, entry, now):
+        pages, seq, enqueued_at, _, _ = entry
+        aging = 1 + (now - enqueued_at) / settings.ADMISSION_AGING_SECONDS
+        return (pages / aging, seq)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiting and self._running < self.max_documents:
+            candidates = [entry for entry in self._waiting if self.can_start(entry[3])]
+            if not candidates:
+                return
+            entry = min(candidates, key=lambda e: self._priority(e, now))
+            self._waiting.remove(entry)
+            entry[4].set_result(self._grant(entry[3]))
+
+    @asynccontextmanager
+    async def admit(self, pages: int, wanted_slots: int = 1):
+        """
+        Espera turno para procesar un documento de `pages` páginas.
+
+        :param wanted_slots: peticiones simultáneas a Tika que usaría (0 si no llama a Tika)
+        :return: (context manager) slots de Tika concedidos
+        """
+        wanted_slots = min(wanted_slots, self.tika_budget)
+        if self.is_saturated() and not self.can_start(wanted_slots):
+            raise AdmissionRejected(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [pages, next(self._seq), time.monotonic(), wanted_slots, future]
+        self._waiting.append(entry)
+        self._dispatch()
+        try:
+            slots = await future
+        except asyncio.CancelledError:
+            # El cliente se fue mientras esperaba: devolver lo concedido o salir de la cola
+            if future.done() and not future.cancelled():
+                self._release(future.result(), wanted_slots)
+            elif entry in self._waiting:
+                self._waiting.remove(entry)
+            raise
+
+        started = time.monotonic()
+        try:
+            yield slots
+        finally:
+            duration = time.monotonic() - started
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._release(slots, wanted_slots)
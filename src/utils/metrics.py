@@ -0,0 +1,48 @@
+import os
+import sqlite3
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_schema_ready = False
+
+
+def _connect():
+    """
+    Los contadores viven en una tabla SQLite (por defecto la misma base de la cola)
+    para que la API, sus workers de uvicorn y los split_worker sumen en el mismo lugar.
+    """
+    global _schema_ready
+    if not _schema_ready:
+        os.makedirs(os.path.dirname(os.path.abspath(settings.METRICS_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(settings.METRICS_DB_PATH, timeout=30, isolation_level=None)
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS metrics (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        _schema_ready = True
+    return conn
+
+
+def incr(name: str, value: int = 1):
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT INTO metrics (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, value)
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        # Perder un contador no debe hacer fallar una ingesta
+        logger.warning(f"No se pudo actualizar la métrica {name}: {e}")
+
+
+def snapshot() -> dict:
+    conn = _connect()
+    try:
+        return dict(conn.execute("SELECT name, value FROM metrics").fetchall())
+    finally:
+        conn.close()
@@ -1,8 +1,18 @@
 import fitz  # PyMuPDF
 import tempfile
 import os
+import queue
+import threading
+import paramiko
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ftplib import FTP
 from pathlib import Path
+from stat import S_ISREG
+from pypdf import PdfReader
+from src.config.settings import settings
 from src.utils.logger import setup_logger
+from src.utils.remote_file import SFTPBlockReader, FTPBlockReader
 
 logger = setup_logger(__name__)
 
@@ -15,8 +25,247 @@ SFTP_HOST = os.getenv("FTP_HOST")
 SFTP_PORT = int(os.getenv("FTP_PORT", 22))
 SFTP_DIR = os.getenv("FTP_DIR")
 
+FTP_USER = os.getenv("FTP_USER")
+FTP_PASSWORD = os.getenv("FTP_PASSWORD")
+FTP_HOST = os.getenv("FTP_HOST")
+
+# Claves que devuelve doc.metadata de PyMuPDF, para mantener el mismo formato
+PDF_INFO_KEYS = {
+    "title": "/Title",
+    "author": "/Author",
+    "subject": "/Subject",
+    "keywords": "/Keywords",
+    "creator": "/Creator",
+    "producer": "/Producer",
+    "creationDate": "/CreationDate",
+    "modDate": "/ModDate",
+    "trapped": "/Trapped",
+}
+
+
+class SFTPConnectionPool:
+    """
+    Conjunto acotado de conexiones SFTP reutilizables entre hilos.
+
+    Las conexiones se abren a demanda hasta max_size; un hilo toma una con
+    acquire(), la usa en exclusiva y la devuelve con release().
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._idle = queue.Queue()
+        self._all = []
+        self._opening = 0  # conexiones reservadas que se están abriendo fuera del lock
+        self._lock = threading.Lock()
+
+    def _open(self):
+        transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
+        transport.connect(username=SFTP_USER, password=SFTP_PASSWORD)
+        return transport, paramiko.SFTPClient.from_transport(transport)
+
+    def _discard(self, conn):
+        """Saca del pool una conexión caída para que se pueda abrir otra en su lugar."""
+        transport, sftp = conn
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        try:
+            sftp.close()
+            transport.close()
+        except Exception:
+            pass
+        logger.warning("Conexión SFTP caída descartada del pool")
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    reserved = len(self._all) + self._opening < self.max_size
+                    if reserved:
+                        self._opening += 1
+                if reserved:
+                    # El handshake SSH se hace sin el lock: varias conexiones se abren en paralelo
+                    try:
+                        conn = self._open()
+                    except Exception:
+                        with self._lock:
+                            self._opening -= 1
+                        raise
+                    with self._lock:
+                        self._opening -= 1
+                        self._all.append(conn)
+                    return conn
+                # Espera con timeout: si otra conexión se descarta, hay lugar para abrir una nueva
+                try:
+                    conn = self._idle.get(timeout=1)
+                except queue.Empty:
+                    continue
+            if conn[0].is_active():
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        if conn[0].is_active():
+            self._idle.put(conn)
+        else:
+            self._discard(conn)
+
+    def close(self):
+        with self._lock:
+            for transport, sftp in self._all:
+                try:
+                    sftp.close()
+                    transport.close()
+                except Exception as e:
+                    logger.warning(f"Error cerrando conexión SFTP: {e}")
+            self._all = []
+
+
+# Caché de metadatos por ruta remota; una entrada vale mientras no cambien tamaño ni mtime
+_metadata_cache = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+
+
+def _cache_get(remote_pdf_path, file_stats):
+    with _metadata_cache_lock:
+        entry = _metadata_cache.get(remote_pdf_path)
+        if entry is None:
+            return None
+        size, mtime, result = entry
+        if size != file_stats.st_size or mtime != file_stats.st_mtime:
+            del _metadata_cache[remote_pdf_path]
+            return None
+        _metadata_cache.move_to_end(remote_pdf_path)
+        return result
+
+
+def _cache_put(remote_pdf_path, file_stats, result):
+    with _metadata_cache_lock:
+        _metadata_cache[remote_pdf_path] = (file_stats.st_size, file_stats.st_mtime, result)
+        _metadata_cache.move_to_end(remote_pdf_path)
+        while len(_metadata_cache) > settings.METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+
+
 class  UtilsPDFMethods:   
 
+    def __init__(self):
+        self.transport = None
+        self.sftp = None
+
+    def connect(self):
+        """Establecer conexión SFTP usando paramiko"""
+        self.transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
+        self.transport.connect(username=SFTP_USER, password=SFTP_PASSWORD)
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+
+    def disconnect(self):
+        """Cerrar conexión SFTP"""
+        if self.sftp:
+            self.sftp.close()
+        if self.transport:
+            self.transport.close()
+        self.sftp = None
+        self.transport = None
+
+    def _primeras_paginas(self, nodo, cantidad, heredado=None):
+        """Recorre el árbol /Pages hasta juntar `cantidad` páginas, sin cargar el resto del árbol."""
+        heredado = dict(heredado or {})
+        for clave in ("/MediaBox", "/CropBox", "/Rotate"):
+            if clave in nodo:
+                heredado[clave] = nodo[clave]
+
+        if "/Kids" not in nodo:
+            yield heredado
+            return
+
+        restantes = cantidad
+        for kid in nodo["/Kids"]:
+            if restantes <= 0:
+                return
+            for pagina in self._primeras_paginas(kid.get_object(), restantes, heredado):
+                yield pagina
+                restantes -= 1
+                if restantes <= 0:
+                    return
+
+    def _inspeccionar_stream(self, stream, paginas_muestra: int = 3):
+        """
+        Lee metadatos, número de páginas y tamaño de las primeras páginas de un PDF
+        desde un archivo con acceso aleatorio (p. ej. un BlockCachedReader remoto).
+
+        pypdf solo lee el trailer, la xref y los objetos que se consultan. PyMuPDF
+        no sirve aquí porque fitz.open(stream=...) exige el archivo completo en memoria.
+        """
+        # strict=True: en modo tolerante pypdf visita todos los objetos de la xref para
+        # validarlos, lo que obligaría a leer el archivo completo. Si el PDF está
+        # dañado, get_metadata cae al camino de descarga completa.
+        reader = PdfReader(stream, strict=True)
+        encryption = None
+        if reader.is_encrypted:
+            encryption = "Standard"
+            reader.decrypt("")
+
+        info = reader.trailer["/Info"].get_object() if "/Info" in reader.trailer else {}
+        metadata = {"format": reader.pdf_header.lstrip("%").replace("-", " ")}
+        for clave, clave_pdf in PDF_INFO_KEYS.items():
+            metadata[clave] = str(info[clave_pdf]) if clave_pdf in info else ""
+        metadata["encryption"] = encryption
+
+        pages = reader.trailer["/Root"]["/Pages"].get_object()
+        num_pages = int(pages["/Count"])
+
+        page_info = []
+        for page_num, pagina in enumerate(self._primeras_paginas(pages, min(paginas_muestra, num_pages))):
+            x0, y0, x1, y1 = [float(v) for v in (pagina.get("/CropBox") or pagina["/MediaBox"])]
+            rotacion = int(pagina.get("/Rotate", 0)) % 360
+            ancho, alto = abs(x1 - x0), abs(y1 - y0)
+            if rotacion in (90, 270):  # page.rect de PyMuPDF ya viene rotado
+                ancho, alto = alto, ancho
+            page_info.append({
+                "numero": page_num + 1,
+                "ancho_pts": ancho,
+                "alto_pts": alto,
+                "rotacion": rotacion
+            })
+        return metadata, num_pages, page_info
+
+    def _inspeccionar_descargando(self, sftp, remote_pdf_path: str):
+        """Camino anterior: descarga el PDF completo y lo abre con PyMuPDF. Solo como respaldo."""
+        local_temp_file = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+                local_temp_file = tmp_file.name
+
+            logger.info(f"Descargando {remote_pdf_path} para análisis de metadatos...")
+            sftp.get(remote_pdf_path, local_temp_file)
+
+            with fitz.open(local_temp_file) as doc:
+                metadata = doc.metadata  # Diccionario con metadatos internos
+                num_pages = len(doc)
+
+                # Información adicional del documento
+                page_info = []
+                for page_num in range(min(3, num_pages)):  # Solo primeras 3 páginas para performance
+                    page = doc[page_num]
+                    page_info.append({
+                        "numero": page_num + 1,
+                        "ancho_pts": page.rect.width,
+                        "alto_pts": page.rect.height,
+                        "rotacion": page.rotation
+                    })
+            return metadata, num_pages, page_info
+        finally:
+            # Limpiar archivo temporal
+            if local_temp_file and os.path.exists(local_temp_file):
+                try:
+                    os.unlink(local_temp_file)
+                    logger.debug(f"🗑️ Archivo temporal eliminado: {local_temp_file}")
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo eliminar archivo temporal {local_temp_file}: {e}")
+
     def getMetadata_LEGACY(self, pdf_path):
         try:
             pdf = fitz.open(pdf_path)
@@ -43,52 +292,150 @@ class  UtilsPDFMethods:
         if not remote_pdf_path.startswith('/'):
             remote_pdf_path = f"{SFTP_DIR}/{remote_pdf_path}"
         
-        # Crear archivo temporal local único
-        local_temp_file = None
-        
         try:
             self.connect()
             
             # 1. Verificar que el archivo existe en el servidor
             try:
                 file_stats = self.sftp.stat(remote_pdf_path)
-                remote_file_size = file_stats.st_size
             except FileNotFoundError:
                 raise FileNotFoundError(f"❌ No se encontró el archivo remoto: {remote_pdf_path}")
             
-            # 2. Crear archivo temporal local
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                local_temp_file = tmp_file.name
-                
-            # 3. Descargar archivo desde SFTP
-            logger.info(f"Descargando {remote_pdf_path} para análisis de metadatos...")
-            self.sftp.get(remote_pdf_path, local_temp_file)
+            return self._metadata_sftp(self.sftp, remote_pdf_path, file_stats)
             
-            # 4. Extraer metadatos usando PyMuPDF
-            with fitz.open(local_temp_file) as doc:
-                metadata = doc.metadata  # Diccionario con metadatos internos
-                num_pages = len(doc)
-                
-                # Información adicional del documento
-                page_info = []
-                for page_num in range(min(3, num_pages)):  # Solo primeras 3 páginas para performance
-                    page = doc[page_num]
-                    page_info.append({
-                        "numero": page_num + 1,
-                        "ancho_pts": page.rect.width,
-                        "alto_pts": page.rect.height,
-                        "rotacion": page.rotation
-                    })
+        except Exception as e:
+            logger.error(f"❌ Error extrayendo metadatos de {remote_pdf_path}: {str(e)}")
+            raise
             
-            # 5. Calcular tamaño en MB
+        finally:
+            self.disconnect()
+
+    def _metadata_sftp(self, sftp, remote_pdf_path: str, file_stats):
+        """Arma el resultado de get_metadata con una conexión ya abierta, usando la caché."""
+        result = _cache_get(remote_pdf_path, file_stats)
+        if result is not None:
+            logger.debug(f"Metadatos en caché: {remote_pdf_path}")
+            return result
+
+        remote_file_size = file_stats.st_size
+
+        # 2-4. Leer solo los bloques necesarios del PDF remoto
+        try:
+            with SFTPBlockReader(sftp, remote_pdf_path) as reader:
+                metadata, num_pages, page_info = self._inspeccionar_stream(reader)
+                logger.info(f"Leídos {reader.bytes_fetched} de {remote_file_size} bytes de {remote_pdf_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Lectura parcial falló para {remote_pdf_path} ({e}), descargando completo")
+            metadata, num_pages, page_info = self._inspeccionar_descargando(sftp, remote_pdf_path)
+        
+        # 5. Calcular tamaño en MB
+        file_size_mb = remote_file_size / (1024 * 1024)
+        
+        # 6. Extraer nombre del archivo de la ruta
+        file_name = os.path.basename(remote_pdf_path)
+        
+        # 7. Armar resultado completo
+        result = {
+            "nombre_archivo": file_name,
+            "ruta_remota": remote_pdf_path,
+            "peso_bytes": remote_file_size,
+            "peso_mb": round(file_size_mb, 2),
+            "paginas": num_pages,
+            "metadatos_pdf": metadata,
+            "info_paginas_muestra": page_info,
+            "servidor": {
+                "host": SFTP_HOST,
+                "directorio": os.path.dirname(remote_pdf_path)
+            }
+        }
+        _cache_put(remote_pdf_path, file_stats, result)
+        
+        logger.info(f"✅ Metadatos extraídos: {file_name} ({num_pages} páginas, {file_size_mb:.2f} MB)")
+        return result
+
+    def get_metadata_batch(self, paths=None, directory: str = None, max_workers: int = None):
+        """
+        Extrae metadatos de muchos PDFs remotos en paralelo.
+
+        Los archivos se inspeccionan con un pool acotado de hilos que comparten
+        max_workers conexiones SFTP. Los resultados se devuelven (generador) a
+        medida que terminan, no en el orden de entrada. Cada archivo con error
+        produce {"ruta_remota": ..., "error": ...} sin cortar el lote.
+
+        Args:
+            paths (list[str]): Rutas de PDFs (absolutas o relativas a SFTP_DIR)
+            directory (str): Directorio remoto cuyos *.pdf se inspeccionan (no recursivo)
+            max_workers (int): Máximo de archivos en paralelo (acotado por METADATA_MAX_WORKERS)
+        """
+        # El valor del cliente solo puede bajar el tope configurado, nunca subirlo
+        max_workers = max(1, min(max_workers or settings.METADATA_MAX_WORKERS, settings.METADATA_MAX_WORKERS))
+        pool = SFTPConnectionPool(max_workers)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def inspeccionar(remote_pdf_path, file_stats=None):
+            try:
+                conn = pool.acquire()
+            except Exception as e:
+                logger.error(f"❌ No se pudo conectar para {remote_pdf_path}: {str(e)}")
+                return {"ruta_remota": remote_pdf_path, "error": str(e)}
+            try:
+                sftp = conn[1]
+                if file_stats is None:
+                    file_stats = sftp.stat(remote_pdf_path)
+                return self._metadata_sftp(sftp, remote_pdf_path, file_stats)
+            except Exception as e:
+                logger.error(f"❌ Error extrayendo metadatos de {remote_pdf_path}: {str(e)}")
+                return {"ruta_remota": remote_pdf_path, "error": str(e)}
+            finally:
+                pool.release(conn)
+
+        try:
+            futures = []
+            if directory is not None:
+                if not directory.startswith('/'):
+                    directory = f"{SFTP_DIR}/{directory}"
+                # El listado ya trae tamaño y mtime: no hace falta un stat por archivo
+                try:
+                    conn = pool.acquire()
+                    try:
+                        entries = conn[1].listdir_attr(directory)
+                    finally:
+                        pool.release(conn)
+                except Exception as e:
+                    logger.error(f"❌ Error listando {directory}: {str(e)}")
+                    yield {"ruta_remota": directory, "error": str(e)}
+                    entries = []
+                for entry in entries:
+                    if entry.filename.lower().endswith(".pdf") and S_ISREG(entry.st_mode or 0):
+                        futures.append(executor.submit(inspeccionar, f"{directory}/{entry.filename}", entry))
+
+            for remote_pdf_path in paths or []:
+                if not remote_pdf_path.startswith('/'):
+                    remote_pdf_path = f"{SFTP_DIR}/{remote_pdf_path}"
+                futures.append(executor.submit(inspeccionar, remote_pdf_path))
+
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Si el consumidor corta el stream, no seguir con lo pendiente
+            executor.shutdown(wait=True, cancel_futures=True)
+            pool.close()
+
+    def get_metadata_ftp(self, remote_pdf_path: str):
+        """
+        Igual que get_metadata pero sobre FTP simple: los bloques se piden con RETR + REST.
+        """
+        ftp = FTP(FTP_HOST)
+        ftp.login(FTP_USER, FTP_PASSWORD)
+        try:
+            with FTPBlockReader(ftp, remote_pdf_path) as reader:
+                remote_file_size = reader.size
+                metadata, num_pages, page_info = self._inspeccionar_stream(reader)
+                logger.info(f"Leídos {reader.bytes_fetched} de {remote_file_size} bytes de {remote_pdf_path}")
+
             file_size_mb = remote_file_size / (1024 * 1024)
-            
-            # 6. Extraer nombre del archivo de la ruta
-            file_name = os.path.basename(remote_pdf_path)
-            
-            # 7. Armar resultado completo
-            result = {
-                "nombre_archivo": file_name,
+            return {
+                "nombre_archivo": os.path.basename(remote_pdf_path),
                 "ruta_remota": remote_pdf_path,
                 "peso_bytes": remote_file_size,
                 "peso_mb": round(file_size_mb, 2),
@@ -96,25 +443,12 @@ class  UtilsPDFMethods:
                 "metadatos_pdf": metadata,
                 "info_paginas_muestra": page_info,
                 "servidor": {
-                    "host": SFTP_HOST,
+                    "host": FTP_HOST,
                     "directorio": os.path.dirname(remote_pdf_path)
                 }
             }
-            
-            logger.info(f"✅ Metadatos extraídos: {file_name} ({num_pages} páginas, {file_size_mb:.2f} MB)")
-            return result
-            
         except Exception as e:
             logger.error(f"❌ Error extrayendo metadatos de {remote_pdf_path}: {str(e)}")
             raise
-            
         finally:
-            # Limpiar archivo temporal
-            if local_temp_file and os.path.exists(local_temp_file):
-                try:
-                    os.unlink(local_temp_file)
-                    logger.debug(f"🗑️ Archivo temporal eliminado: {local_temp_file}")
-                except Exception as e:
-                    logger.warning(f"⚠️ No se pudo eliminar archivo temporal {local_temp_file}: {e}")
-            
-            self.disconnect()
+            ftp.quit()
@@ -0,0 +1,139 @@
+import io
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from ftplib import FTP, error_perm, error_temp
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_CACHE_BLOCKS = 256
+
+
+class BlockCachedReader(io.RawIOBase, ABC):
+    """
+    Archivo remoto de solo lectura con acceso aleatorio.
+
+    Los bytes se piden al servidor en bloques de tamaño fijo y solo cuando se
+    leen; los últimos bloques usados se guardan en una caché LRU. Así un lector
+    de PDF que solo necesita el trailer, la xref y unos pocos objetos transfiere
+    unos KB en lugar del archivo completo.
+
+    Las subclases implementan _fetch(offset, length); sin él no se pueden instanciar.
+    """
+
+    def __init__(self, size: int, block_size: int = DEFAULT_BLOCK_SIZE, cache_blocks: int = DEFAULT_CACHE_BLOCKS):
+        # io.RawIOBase tiene su propio __new__ en C, que no aplica el chequeo de ABC
+        if self.__abstractmethods__:
+            raise TypeError(
+                f"Can't instantiate abstract class {type(self).__name__} "
+                f"with abstract methods {', '.join(sorted(self.__abstractmethods__))}"
+            )
+        super().__init__()
+        self.size = size
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.position = 0
+        self.bytes_fetched = 0
+        self._cache = OrderedDict()
+
+    @abstractmethod
+    def _fetch(self, offset: int, length: int) -> bytes:
+        """Lee del servidor `length` bytes desde `offset`."""
+
+    def _get_block(self, index: int) -> bytes:
+        block = self._cache.get(index)
+        if block is not None:
+            self._cache.move_to_end(index)
+            return block
+
+        offset = index * self.block_size
+        block = self._fetch(offset, min(self.block_size, self.size - offset))
+        self.bytes_fetched += len(block)
+        self._cache[index] = block
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return block
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if position < 0:
+            raise ValueError("Posición negativa")
+        self.position = position
+        return self.position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        wanted = min(len(view), max(0, self.size - self.position))
+        written = 0
+        while written < wanted:
+            index, block_offset = divmod(self.position, self.block_size)
+            block = self._get_block(index)
+            chunk = block[block_offset:block_offset + wanted - written]
+            if not chunk:
+                break
+            view[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self.position += len(chunk)
+        return written
+
+
+class SFTPBlockReader(BlockCachedReader):
+    """Lector por bloques sobre un SFTPClient de paramiko ya conectado."""
+
+    def __init__(self, sftp, remote_path: str, **kwargs):
+        self._file = sftp.open(remote_path, "rb")
+        super().__init__(self._file.stat().st_size, **kwargs)
+
+    def _fetch(self, offset, length):
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+class FTPBlockReader(BlockCachedReader):
+    """Lector por bloques sobre FTP: cada bloque es un RETR con REST y se corta al completar el bloque."""
+
+    def __init__(self, ftp: FTP, remote_path: str, **kwargs):
+        self._ftp = ftp
+        self._remote_path = remote_path
+        self._ftp.voidcmd("TYPE I")
+        super().__init__(self._ftp.size(remote_path), **kwargs)
+
+    def _fetch(self, offset, length):
+        conn = self._ftp.transfercmd(f"RETR {self._remote_path}", rest=offset)
+        data = bytearray()
+        try:
+            while len(data) < length:
+                chunk = conn.recv(min(length - len(data), 65536))
+                if not chunk:
+                    break
+                data.extend(chunk)
+        finally:
+            conn.close()
+        # Al cortar la transferencia el servidor responde 426/451 (o 226 si ya terminó)
+        try:
+            self._ftp.voidresp()
+        except (error_temp, error_perm):
+            pass
+        return bytes(data)
@@ -0,0 +1,52 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock no hay límite entre procesos
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+if fcntl is None:
+    logger.warning("fcntl no disponible: el límite global de peticiones a Tika queda desactivado")
+
+
+@contextmanager
+def tika_slot():
+    """
+    Ocupa uno de los TIKA_MAX_INFLIGHT slots globales durante una petición a Tika.
+
+    Cada slot es un archivo en TIKA_SLOTS_DIR bloqueado con flock, así el límite
+    lo comparten todos los procesos que vean ese directorio: la API (y sus hijos
+    del fan-out), otros workers de uvicorn y los contenedores de split_worker.
+    El sistema operativo libera el lock si un proceso muere con el slot tomado.
+    No hay prioridad entre procesos: el slot libre lo toma quien consulte primero
+    (la prioridad por tamaño del AdmissionScheduler solo rige dentro de la API).
+    """
+    if fcntl is None or settings.TIKA_MAX_INFLIGHT <= 0:
+        yield
+        return
+
+    os.makedirs(settings.TIKA_SLOTS_DIR, exist_ok=True)
+    slots = list(range(settings.TIKA_MAX_INFLIGHT))
+    while True:
+        random.shuffle(slots)
+        for slot in slots:
+            fd = os.open(os.path.join(settings.TIKA_SLOTS_DIR, f"slot_{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        time.sleep(settings.TIKA_SLOT_POLL_INTERVAL)